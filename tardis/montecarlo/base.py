@@ -264,6 +264,17 @@ class MontecarloTransport(HDFWriterMixin):
             self.spectrum_frequency, self.montecarlo_virtual_luminosity
         )
 
+    @property
+    def integrator_settings(self):
+        return self._integrator_settings
+
+    @integrator_settings.setter
+    def integrator_settings(self, integrator_settings):
+        # the integrated spectrum depends on the settings, so it is
+        # recomputed on the next access
+        self._integrator_settings = integrator_settings
+        self._spectrum_integrated = None
+
     @property
     def spectrum_integrated(self):
         if self._spectrum_integrated is None:
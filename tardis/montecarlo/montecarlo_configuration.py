@@ -13,6 +13,7 @@ tau_russian = 10.0
 
 INITIAL_TRACKING_ARRAY_LENGTH = None
 LEGACY_MODE_ENABLED = False
+BB_EXPONENTIAL_SAMPLING_ENABLED = False
 VPACKET_LOGGING = False
 RPACKET_TRACKING = False
 CONTINUUM_PROCESSES_ENABLED = False
@@ -1,14 +1,154 @@
 import abc
+import math
+from functools import lru_cache
+from typing import NamedTuple
 
 import numpy as np
-import numexpr as ne
+from numba import njit, prange
 from tardis import constants as const
 from tardis.montecarlo import (
     montecarlo_configuration as montecarlo_configuration,
 )
+from tardis.montecarlo.montecarlo_numba import njit_dict
 
 from astropy import units as u
 
+KB_OVER_H_CGS = const.k_B.cgs.value / const.h.cgs.value
+FOUR_PI_SIGMA_SB = 4 * np.pi * const.sigma_sb.cgs
+# Largest l table that is searched linearly for l_min; larger tables use a
+# binary search
+MAX_L_SAMPLES_LINEAR_SCAN = 1000
+
+
+@lru_cache(maxsize=8)
+def _bjorkman_wood_l_table(l_samples):
+    """
+    Cumulative sum of :math:`i^{-4}` used to find :math:`l_{\\rm min}` in the
+    Bjorkman & Wood 2001 frequency sampling. The table only depends on
+    ``l_samples`` and is therefore computed once and cached.
+
+    Parameters
+    ----------
+    l_samples : int
+        number of l_samples needed in the algorithm
+
+    Returns
+    -------
+    numpy.ndarray
+        read-only array of cumulative sums
+    """
+    l_table = np.cumsum(np.arange(1, l_samples, dtype=np.float64) ** -4)
+    l_table.flags.writeable = False
+    return l_table
+
+
+@njit(**njit_dict)
+def _bjorkman_wood_l_min(l_threshold, l_table, out):
+    """
+    Find :math:`l_{\\rm min}` for each packet by a linear scan of the l table.
+
+    Most thresholds fall into the first few entries of the table, as
+    :math:`\\sum_{i=1}^{l} i^{-4}` converges quickly, so the scan usually
+    stops after one to three steps. The result is the same as
+    ``l_table.searchsorted(l_threshold) + 1``.
+
+    Parameters
+    ----------
+    l_threshold : numpy.ndarray
+        :math:`{{\\pi^4}\\over{90}} \\xi_0` for each packet
+    l_table : numpy.ndarray
+        cumulative sum of :math:`i^{-4}`
+    out : numpy.ndarray
+        integer output array for :math:`l_{\\rm min}`
+    """
+    table_size = l_table.size
+    for i in prange(out.size):
+        k = 0
+        while k < table_size and l_table[k] < l_threshold[i]:
+            k += 1
+        out[i] = k + 1
+
+
+@njit(**njit_dict)
+def _bjorkman_wood_frequencies(xi1, xi2, xi3, xi4, l, out):
+    """
+    Compute :math:`x = -\\ln{(\\xi_1\\xi_2\\xi_3\\xi_4)}/l_{\\rm min}` in a
+    single pass without materializing the product of the random numbers.
+
+    Parameters
+    ----------
+    xi1, xi2, xi3, xi4 : numpy.ndarray
+        uniform random numbers in [0, 1)
+    l : numpy.ndarray
+        :math:`l_{\\rm min}` for each packet
+    out : numpy.ndarray
+        output array for the dimensionless frequencies :math:`x=h\\nu/kT`
+    """
+    for i in prange(out.size):
+        out[i] = -math.log(xi1[i] * xi2[i] * xi3[i] * xi4[i]) / l[i]
+
+
+@njit(**njit_dict)
+def _zero_limb_darkening_mus(z, out):
+    """
+    Compute :math:`\\mu=\\sqrt{z}` in parallel.
+
+    Parameters
+    ----------
+    z : numpy.ndarray
+        uniform random numbers in [0, 1)
+    out : numpy.ndarray
+        output array for the directions
+    """
+    for i in prange(out.size):
+        out[i] = math.sqrt(z[i])
+
+
+@njit(**njit_dict)
+def _relativistic_mus(z, beta, out):
+    """
+    Compute :math:`\\mu^\\prime = -\\beta + \\sqrt{\\beta^2 + (2\\beta + 1) z}`
+    in a single pass.
+
+    Parameters
+    ----------
+    z : numpy.ndarray
+        uniform random numbers in [0, 1)
+    beta : float
+        velocity of the inner boundary in units of the speed of light
+    out : numpy.ndarray
+        output array for the directions, may be the same array as ``z``
+    """
+    beta2 = beta * beta
+    k = 2.0 * beta + 1.0
+    for i in prange(out.size):
+        out[i] = -beta + math.sqrt(beta2 + k * z[i])
+
+
+class PacketArrays(NamedTuple):
+    """
+    Packet properties stored as a structure of arrays, one array per property.
+
+    As a named tuple it can be indexed and unpacked like the plain tuple
+    ``(radii, nus, mus, energies)`` that ``create_packets`` used to return.
+
+    Parameters
+    ----------
+    radii : numpy.ndarray
+        Packet radii
+    nus : numpy.ndarray
+        Packet frequencies
+    mus : numpy.ndarray
+        Packet directions
+    energies : numpy.ndarray
+        Packet energies
+    """
+
+    radii: np.ndarray
+    nus: np.ndarray
+    mus: np.ndarray
+    energies: np.ndarray
+
 
 class BasePacketSource(abc.ABC):
     """
@@ -40,6 +180,17 @@ class BasePacketSource(abc.ABC):
     def _reseed(self, seed):
         self.rng = np.random.default_rng(seed=seed)
 
+    @property
+    def bit_generator_ctypes(self):
+        """
+        ctypes interface of the bit generator behind ``rng``
+
+        The interface provides the state address and ``next_double`` etc. as
+        function pointers, so numba compiled code can continue the packet
+        random number stream without going back to Python.
+        """
+        return self.rng.bit_generator.ctypes
+
     def create_packet_seeds(self, no_of_packets, seed_offset):
         # the iteration (passed as seed_offset) is added each time to preserve randomness
         # across different simulations with the same temperature,
@@ -47,7 +198,9 @@ class BasePacketSource(abc.ABC):
         # because we call random.sample, which references a different internal
         # state than in the numpy.random module.
         self._reseed(self.base_seed + seed_offset)
-        seeds = self.rng.choice(self.MAX_SEED_VAL, no_of_packets, replace=True)
+        seeds = self.rng.integers(
+            0, self.MAX_SEED_VAL, size=no_of_packets, dtype=np.uint32
+        )
         return seeds
 
     @abc.abstractmethod
@@ -77,24 +230,21 @@ class BasePacketSource(abc.ABC):
         ----------
         no_of_packets : int
             Number of packets
+        *args, **kwargs
+            Passed on to the ``create_packet_*`` methods, e.g. ``dtype`` to
+            create single precision arrays for the black body sources
 
         Returns
         -------
-        array
-            Packet radii
-        array
-            Packet frequencies
-        array
-            Packet directions
-        array
-            Packet energies
+        PacketArrays
+            Packet radii, frequencies, directions and energies
         """
         radii = self.create_packet_radii(no_of_packets, *args, **kwargs)
         nus = self.create_packet_nus(no_of_packets, *args, **kwargs)
         mus = self.create_packet_mus(no_of_packets, *args, **kwargs)
         energies = self.create_packet_energies(no_of_packets, *args, **kwargs)
 
-        return radii, nus, mus, energies
+        return PacketArrays(radii, nus, mus, energies)
 
 
 class BlackBodySimpleSource(BasePacketSource):
@@ -130,12 +280,83 @@ class BlackBodySimpleSource(BasePacketSource):
         self.radius = model.r_inner[0]
         self.temperature = model.t_inner.value
 
-    def create_packets(self, no_of_packets, *args, **kwargs):
+    def _check_state(self):
         if self.radius is None or self.temperature is None:
             raise ValueError("Black body Radius or Temperature isn't set")
-        return super().create_packets(no_of_packets, *args, **kwargs)
 
-    def create_packet_radii(self, no_of_packets):
+    def create_packets(self, no_of_packets, l_samples=1000, dtype=np.float64):
+        """Generate black-body packet properties as arrays
+
+        The uniform random numbers for the frequencies and the directions are
+        drawn as one block and split between them. Unless exponential sampling
+        is enabled, this is the same stream as calling ``create_packet_nus``
+        and ``create_packet_mus`` one after the other. Subclasses that override
+        either of them get the properties from their ``create_packet_*``
+        methods one at a time.
+
+        Parameters
+        ----------
+        no_of_packets : int
+            Number of packets
+        l_samples : int
+            number of l_samples needed in the frequency sampling, only used
+            if ``create_packet_nus`` is not overridden
+        dtype : numpy.dtype, optional
+            floating point type of the returned arrays, by default float64
+
+        Returns
+        -------
+        PacketArrays
+            Packet radii, frequencies, directions and energies
+        """
+        self._check_state()
+        if not self._has_default_samplers():
+            return super().create_packets(no_of_packets, dtype=dtype)
+
+        # xi_0 (and xi_1 to xi_4 without exponential sampling) for the
+        # frequencies and z for the directions
+        exponential_sampling = self._exponential_sampling_enabled()
+        if exponential_sampling:
+            no_of_xis = no_of_packets
+        else:
+            no_of_xis = 5 * no_of_packets
+        uniforms = self._random(no_of_xis + no_of_packets)
+        xis = uniforms[:no_of_xis]
+        if not exponential_sampling:
+            xis = xis.reshape(5, no_of_packets)
+
+        return PacketArrays(
+            self.create_packet_radii(no_of_packets, dtype=dtype),
+            self._create_packet_nus(xis, l_samples=l_samples, dtype=dtype),
+            self._create_packet_mus(uniforms[no_of_xis:], dtype=dtype),
+            self.create_packet_energies(no_of_packets, dtype=dtype),
+        )
+
+    def _has_default_samplers(self):
+        # the block drawn in create_packets is split between the samplers of
+        # this class only, overridden ones draw their own numbers
+        cls = type(self)
+        return (
+            cls.create_packet_nus is BlackBodySimpleSource.create_packet_nus
+            and cls.create_packet_mus is BlackBodySimpleSource.create_packet_mus
+        )
+
+    @staticmethod
+    def _exponential_sampling_enabled():
+        # sampling the frequencies with exponential variates changes the
+        # packets drawn for a seed, so it is opt-in and off in legacy mode
+        return (
+            montecarlo_configuration.BB_EXPONENTIAL_SAMPLING_ENABLED
+            and not montecarlo_configuration.LEGACY_MODE_ENABLED
+        )
+
+    def _random(self, size):
+        # For testing purposes
+        if montecarlo_configuration.LEGACY_MODE_ENABLED:
+            return np.random.random(size)
+        return self.rng.random(size)
+
+    def create_packet_radii(self, no_of_packets, dtype=np.float64):
         """
         Create packet radii
 
@@ -143,15 +364,21 @@ class BlackBodySimpleSource(BasePacketSource):
         ----------
         no_of_packets : int
             number of packets to be created
+        dtype : numpy.dtype, optional
+            floating point type of the returned array, by default float64
 
         Returns
         -------
         Radii for packets
             numpy.ndarray
         """
-        return np.ones(no_of_packets) * self.radius
+        # np.repeat keeps the unit if the radius is a Quantity while still
+        # allocating the output only once
+        return np.repeat(self.radius, no_of_packets).astype(dtype, copy=False)
 
-    def create_packet_nus(self, no_of_packets, l_samples=1000):
+    def create_packet_nus(
+        self, no_of_packets, l_samples=1000, dtype=np.float64
+    ):
         """
         Create packet :math:`\\nu` distributed using the algorithm described in
         Bjorkman & Wood 2001 (page 4) which references
@@ -168,33 +395,88 @@ class BlackBodySimpleSource(BasePacketSource):
             x = -\\ln{(\\xi_1\\xi_2\\xi_3\\xi_4)}/l_{\\rm min}\\;.
         where :math:`x=h\\nu/kT`
 
+        If ``montecarlo_configuration.BB_EXPONENTIAL_SAMPLING_ENABLED`` is set
+        (and legacy mode is not), :math:`-\\ln{(\\xi_1\\xi_2\\xi_3\\xi_4)}`
+        is sampled directly as the sum of four standard exponential variates,
+        which avoids the logarithm and the underflow of the product.
+
         Parameters
         ----------
         no_of_packets : int
         l_samples : int
             number of l_samples needed in the algorithm
+        dtype : numpy.dtype, optional
+            floating point type of the returned array, by default float64
+
+        Returns
+        -------
+        array of frequencies
+            numpy.ndarray
+        """
+        if self._exponential_sampling_enabled():
+            xis = self._random(no_of_packets)
+        else:
+            xis = self._random(5 * no_of_packets).reshape(5, no_of_packets)
+        return self._create_packet_nus(xis, l_samples=l_samples, dtype=dtype)
+
+    def _create_packet_nus(self, xis, l_samples=1000, dtype=np.float64):
+        """
+        Create packet :math:`\\nu` from given uniform random numbers, see
+        ``create_packet_nus``
+
+        Parameters
+        ----------
+        xis : numpy.ndarray
+            :math:`\\xi_0` to :math:`\\xi_4` with shape (5, no_of_packets), or
+            only :math:`\\xi_0` with exponential sampling. Overwritten.
+        l_samples : int
+            number of l_samples needed in the algorithm
+        dtype : numpy.dtype, optional
+            floating point type of the returned array, by default float64
 
         Returns
         -------
         array of frequencies
             numpy.ndarray
         """
-        l_array = np.cumsum(np.arange(1, l_samples, dtype=np.float64) ** -4)
+        l_array = _bjorkman_wood_l_table(l_samples)
         l_coef = np.pi**4 / 90.0
 
-        # For testing purposes
-        if montecarlo_configuration.LEGACY_MODE_ENABLED:
-            xis = np.random.random((5, no_of_packets))
+        exponential_sampling = self._exponential_sampling_enabled()
+        if exponential_sampling:
+            xi0 = xis
         else:
-            xis = self.rng.random((5, no_of_packets))
-
-        l = l_array.searchsorted(xis[0] * l_coef) + 1.0
-        xis_prod = np.prod(xis[1:], 0)
-        x = ne.evaluate("-log(xis_prod)/l")
+            xi0 = xis[0]
+        no_of_packets = xi0.size
+
+        # l_min is kept as an integer array and only converted to float in the
+        # division by it
+        np.multiply(xi0, l_coef, out=xi0)
+        if l_samples <= MAX_L_SAMPLES_LINEAR_SCAN:
+            l = np.empty(no_of_packets, dtype=np.int64)
+            _bjorkman_wood_l_min(xi0, l_array, l)
+        else:
+            l = l_array.searchsorted(xi0) + 1
+
+        if exponential_sampling:
+            # -ln(xi_1 xi_2 xi_3 xi_4) is the sum of four Exp(1) variates,
+            # accumulated in place instead of reducing a (4, N) array
+            x = self.rng.standard_exponential(no_of_packets)
+            exp_variates = np.empty_like(x)
+            for _ in range(3):
+                x += self.rng.standard_exponential(out=exp_variates)
+            x /= l
+        else:
+            x = np.empty(no_of_packets)
+            _bjorkman_wood_frequencies(xis[1], xis[2], xis[3], xis[4], l, x)
 
-        return x * (const.k_B.cgs.value * self.temperature) / const.h.cgs.value
+        # l_array and the sampling stay in double precision, only the result
+        # is converted
+        return (x * (KB_OVER_H_CGS * self.temperature)).astype(
+            dtype, copy=False
+        )
 
-    def create_packet_mus(self, no_of_packets):
+    def create_packet_mus(self, no_of_packets, dtype=np.float64):
         """
         Create zero-limb-darkening packet :math:`\mu` distributed
         according to :math:`\\mu=\\sqrt{z}, z \isin [0, 1]`
@@ -203,20 +485,41 @@ class BlackBodySimpleSource(BasePacketSource):
         ----------
         no_of_packets : int
             number of packets to be created
+        dtype : numpy.dtype, optional
+            floating point type of the returned array, by default float64
 
         Returns
         -------
         Directions for packets
             numpy.ndarray
         """
+        return self._create_packet_mus(self._random(no_of_packets), dtype=dtype)
 
-        # For testing purposes
-        if montecarlo_configuration.LEGACY_MODE_ENABLED:
-            return np.sqrt(np.random.random(no_of_packets))
-        else:
-            return np.sqrt(self.rng.random(no_of_packets))
+    def _create_packet_mus(self, z, dtype=np.float64):
+        """
+        Create zero-limb-darkening packet :math:`\\mu` from given uniform
+        random numbers, see ``create_packet_mus``
 
-    def create_packet_energies(self, no_of_packets):
+        Parameters
+        ----------
+        z : numpy.ndarray
+            uniform random numbers, one per packet
+        dtype : numpy.dtype, optional
+            floating point type of the returned array, by default float64
+
+        Returns
+        -------
+        Directions for packets
+            numpy.ndarray
+        """
+        # writing to a new array keeps the directions from holding on to the
+        # whole block of random numbers drawn in create_packets
+        no_of_packets = z.size
+        mus = np.empty(no_of_packets, dtype=dtype)
+        _zero_limb_darkening_mus(z, mus)
+        return mus
+
+    def create_packet_energies(self, no_of_packets, dtype=np.float64):
         """
         Uniformly distribute energy in arbitrary units where the ensemble of
         packets has energy of 1.
@@ -225,13 +528,15 @@ class BlackBodySimpleSource(BasePacketSource):
         ----------
         no_of_packets : int
             number of packets
+        dtype : numpy.dtype, optional
+            floating point type of the returned array, by default float64
 
         Returns
         -------
         energies for packets
             numpy.ndarray
         """
-        return np.ones(no_of_packets) / no_of_packets
+        return np.full(no_of_packets, 1.0 / no_of_packets, dtype=dtype)
 
     def set_temperature_from_luminosity(self, luminosity: u.Quantity):
         """
@@ -244,8 +549,7 @@ class BlackBodySimpleSource(BasePacketSource):
 
         """
         self.temperature = (
-            (luminosity / (4 * np.pi * self.radius**2 * const.sigma_sb))
-            ** 0.25
+            (luminosity / (FOUR_PI_SIGMA_SB * self.radius**2)) ** 0.25
         ).to("K")
 
 
@@ -289,31 +593,31 @@ class BlackBodySimpleSourceRelativistic(BlackBodySimpleSource):
         self.time_explosion = model.time_explosion
         super().set_state_from_model(model)
 
-    def create_packets(self, no_of_packets):
+    def _check_state(self):
+        if self.radius is None or self.time_explosion is None:
+            raise ValueError("Black body Radius or Time of Explosion isn't set")
+        super()._check_state()
+
+    def create_packets(self, no_of_packets, dtype=np.float64):
         """Generate relativistic black-body packet properties as arrays
 
         Parameters
         ----------
         no_of_packets : int
             Number of packets
+        dtype : numpy.dtype, optional
+            floating point type of the returned arrays, by default float64
 
         Returns
         -------
-        array
-            Packet radii
-        array
-            Packet frequencies
-        array
-            Packet directions
-        array
-            Packet energies
+        PacketArrays
+            Packet radii, frequencies, directions and energies
         """
-        if self.radius is None or self.time_explosion is None:
-            raise ValueError("Black body Radius or Time of Explosion isn't set")
-        self.beta = ((self.radius / self.time_explosion) / const.c).to("")
-        return super().create_packets(no_of_packets)
+        self._check_state()
+        self.beta = ((self.radius / self.time_explosion) / const.c).to_value("")
+        return super().create_packets(no_of_packets, dtype=dtype)
 
-    def create_packet_nus(self, no_of_packets):
+    def create_packet_nus(self, no_of_packets, dtype=np.float64):
         """
         Create zero-limb-darkening packet :math:`\mu^\prime` distributed
         according to :math:`\\mu^\\prime=2 \\frac{\\mu^\\prime + \\beta}{2 \\beta + 1}`.
@@ -324,17 +628,21 @@ class BlackBodySimpleSourceRelativistic(BlackBodySimpleSource):
         ----------
         no_of_packets : int
             number of packets to be created
+        dtype : numpy.dtype, optional
+            floating point type of the returned array, by default float64
 
         Returns
         -------
         array of frequencies
             numpy.ndarray
         """
+        # draw in double precision so the packets do not depend on dtype
         z = self.rng.random(no_of_packets)
-        beta = self.beta
-        return -beta + np.sqrt(beta**2 + 2 * beta * z + z)
+        mus = np.empty(no_of_packets, dtype=dtype)
+        _relativistic_mus(z, self.beta, mus)
+        return mus
 
-    def create_packet_energies(self, no_of_packets):
+    def create_packet_energies(self, no_of_packets, dtype=np.float64):
         """
         Uniformly distribute energy in arbitrary units where the ensemble of
         packets has energy of 1 multiplied by relativistic correction factors.
@@ -343,6 +651,8 @@ class BlackBodySimpleSourceRelativistic(BlackBodySimpleSource):
         ----------
         no_of_packets : int
             number of packets
+        dtype : numpy.dtype, optional
+            floating point type of the returned array, by default float64
 
         Returns
         -------
@@ -352,11 +662,11 @@ class BlackBodySimpleSourceRelativistic(BlackBodySimpleSource):
         beta = self.beta
         gamma = 1.0 / np.sqrt(1 - beta**2)
         static_inner_boundary2cmf_factor = (2 * beta + 1) / (1 - beta**2)
-        energies = np.ones(no_of_packets) / no_of_packets
         # In principle, the factor gamma should be applied to the time of
         # simulation to account for time dilation between the lab and comoving
         # frame. However, all relevant quantities (luminosities, estimators, ...)
         # are calculated as ratios of packet energies and the time of simulation.
         # Thus, we can absorb the factor gamma in the packet energies, which is
         # more convenient.
-        return energies * static_inner_boundary2cmf_factor / gamma
+        energy = static_inner_boundary2cmf_factor / gamma / no_of_packets
+        return np.full(no_of_packets, energy, dtype=dtype)
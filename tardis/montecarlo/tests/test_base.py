@@ -40,3 +40,19 @@ def test_hdf_transport(hdf_file_path, simulation_verysimple, attr):
     path = os.path.join("transport", attr)
     expected = pd.read_hdf(hdf_file_path, path)
     assert_almost_equal(actual, expected.values)
+
+
+def test_integrator_settings_resets_spectrum_integrated(
+    simulation_verysimple, monkeypatch
+):
+    transport = simulation_verysimple.transport
+    monkeypatch.setattr(
+        transport.integrator, "calculate_spectrum", lambda *args, **kwargs: []
+    )
+    monkeypatch.setattr(transport, "_spectrum_integrated", None)
+
+    spectrum_integrated = transport.spectrum_integrated
+    assert transport.spectrum_integrated is spectrum_integrated
+
+    transport.integrator_settings = transport.integrator_settings
+    assert transport.spectrum_integrated is not spectrum_integrated
@@ -3,8 +3,18 @@ import os
 import numpy as np
 import pandas as pd
 import pytest
+from astropy import units as u
+from numba import njit
+from scipy.special import zeta
 
-from tardis.montecarlo.packet_source import BlackBodySimpleSource
+from tardis import constants as const
+from tardis.montecarlo.packet_source import (
+    BlackBodySimpleSource,
+    BlackBodySimpleSourceRelativistic,
+    PacketArrays,
+    _bjorkman_wood_l_min,
+    _bjorkman_wood_l_table,
+)
 from tardis.montecarlo import (
     montecarlo_configuration as montecarlo_configuration,
 )
@@ -34,3 +44,181 @@ def test_bb_packet_sampling(request, tardis_ref_data, packet_unit_test_fpath):
     assert np.all(np.isclose(nus, ref_df["nus"]))
     assert np.all(np.isclose(mus, ref_df["mus"]))
     assert np.all(np.isclose(unif_energies, ref_df["energies"]))
+
+
+@pytest.mark.parametrize("exponential_sampling", [True, False])
+def test_bb_nus_mean_frequency(monkeypatch, exponential_sampling):
+    monkeypatch.setattr(montecarlo_configuration, "LEGACY_MODE_ENABLED", False)
+    monkeypatch.setattr(
+        montecarlo_configuration,
+        "BB_EXPONENTIAL_SAMPLING_ENABLED",
+        exponential_sampling,
+    )
+    bb = BlackBodySimpleSource(base_seed=1963, temperature=10000)
+    bb._reseed(2508)
+    nus = bb.create_packet_nus(100000)
+    x = nus * const.h.cgs.value / (const.k_B.cgs.value * bb.temperature)
+    # mean of x=h nu/kT weighted by the Planck function B_nu
+    assert np.isclose(x.mean(), 4 * zeta(5) / zeta(4), rtol=1e-2)
+
+
+def test_create_packet_seeds():
+    bb = BlackBodySimpleSource(base_seed=1963)
+    seeds = bb.create_packet_seeds(1000, seed_offset=3)
+    assert seeds.dtype == np.uint32
+    assert seeds.shape == (1000,)
+    assert np.all(seeds < BlackBodySimpleSource.MAX_SEED_VAL)
+    # the same iteration reproduces the same seeds
+    assert np.array_equal(seeds, bb.create_packet_seeds(1000, seed_offset=3))
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+@pytest.mark.parametrize(
+    "legacy_mode, exponential_sampling",
+    [(True, False), (False, False), (False, True)],
+)
+def test_bb_packet_dtype(monkeypatch, dtype, legacy_mode, exponential_sampling):
+    monkeypatch.setattr(
+        montecarlo_configuration, "LEGACY_MODE_ENABLED", legacy_mode
+    )
+    monkeypatch.setattr(
+        montecarlo_configuration,
+        "BB_EXPONENTIAL_SAMPLING_ENABLED",
+        exponential_sampling,
+    )
+    bb = BlackBodySimpleSource(
+        radius=1e14, temperature=10000, base_seed=1963, legacy_second_seed=2508
+    )
+    bb.create_packet_seeds(100, seed_offset=0)
+    for packet_property in bb.create_packets(100, dtype=dtype):
+        assert packet_property.dtype == dtype
+        assert np.all(np.isfinite(packet_property))
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_bb_relativistic_packet_dtype(dtype):
+    bb = BlackBodySimpleSourceRelativistic(
+        time_explosion=13 * u.day,
+        radius=1e14 * u.cm,
+        temperature=10000,
+        base_seed=1963,
+    )
+    bb.create_packet_seeds(100, seed_offset=0)
+    radii, nus, mus, energies = bb.create_packets(100, dtype=dtype)
+    for packet_property in (radii.value, nus, mus, energies):
+        assert packet_property.dtype == dtype
+    assert np.all((mus >= 0) & (mus <= 1))
+
+
+def test_create_packets_returns_packet_arrays():
+    bb = BlackBodySimpleSource(radius=1e14, temperature=10000, base_seed=1963)
+    bb.create_packet_seeds(100, seed_offset=0)
+    packets = bb.create_packets(100)
+    assert isinstance(packets, PacketArrays)
+    radii, nus, mus, energies = packets
+    assert radii is packets.radii
+    assert nus is packets.nus
+    assert mus is packets.mus
+    assert energies is packets.energies
+    assert len(packets) == 4
+    assert packets[1] is packets.nus
+
+
+def test_bb_create_packets_matches_legacy_stream(monkeypatch):
+    monkeypatch.setattr(montecarlo_configuration, "LEGACY_MODE_ENABLED", True)
+    bb = BlackBodySimpleSource(
+        radius=1e14, temperature=10000, base_seed=1963, legacy_second_seed=2508
+    )
+    _, nus, mus, _ = bb.create_packets(100)
+
+    bb = BlackBodySimpleSource(
+        radius=1e14, temperature=10000, base_seed=1963, legacy_second_seed=2508
+    )
+    np.testing.assert_array_equal(nus, bb.create_packet_nus(100))
+    np.testing.assert_array_equal(mus, bb.create_packet_mus(100))
+
+
+def test_bb_create_packets_keeps_rng_stream(monkeypatch):
+    monkeypatch.setattr(montecarlo_configuration, "LEGACY_MODE_ENABLED", False)
+    bb = BlackBodySimpleSource(radius=1e14, temperature=10000, base_seed=1963)
+    bb.create_packet_seeds(100, seed_offset=0)
+    _, nus, mus, _ = bb.create_packets(100)
+
+    # without exponential sampling, the packets of a seed are the ones of
+    # five uniforms per frequency followed by one per direction
+    rng = np.random.default_rng(1963)
+    rng.integers(0, BlackBodySimpleSource.MAX_SEED_VAL, size=100)
+    xis = rng.random((5, 100))
+    l_array = np.cumsum(np.arange(1, 1000, dtype=np.float64) ** -4)
+    l = l_array.searchsorted(xis[0] * np.pi**4 / 90.0) + 1.0
+    x = -np.log(np.prod(xis[1:], 0)) / l
+    expected_nus = x * const.k_B.cgs.value * 10000 / const.h.cgs.value
+    np.testing.assert_allclose(nus, expected_nus, rtol=1e-13)
+    np.testing.assert_allclose(mus, np.sqrt(rng.random(100)), rtol=1e-15)
+
+
+def test_bit_generator_ctypes_continues_rng_stream():
+    bb = BlackBodySimpleSource(base_seed=1963)
+    bb.create_packet_seeds(10, seed_offset=0)
+    next_double = bb.bit_generator_ctypes.next_double
+    state_address = bb.bit_generator_ctypes.state_address
+
+    @njit
+    def draw(n, state):
+        out = np.empty(n)
+        for i in range(n):
+            out[i] = next_double(state)
+        return out
+
+    reference = BlackBodySimpleSource(base_seed=1963)
+    reference.create_packet_seeds(10, seed_offset=0)
+    np.testing.assert_array_equal(
+        draw(10, state_address), reference.rng.random(10)
+    )
+
+
+@pytest.mark.parametrize("l_samples", [2, 10, 1000])
+def test_bjorkman_wood_l_min_matches_searchsorted(l_samples):
+    l_table = _bjorkman_wood_l_table(l_samples)
+    rng = np.random.default_rng(1963)
+    # include exact table entries and thresholds beyond the end of the table
+    l_threshold = np.concatenate(
+        [rng.random(1000) * np.pi**4 / 90.0, l_table, [l_table[-1] + 1.0]]
+    )
+    l_min = np.empty(l_threshold.size, dtype=np.int64)
+    _bjorkman_wood_l_min(l_threshold, l_table, l_min)
+    np.testing.assert_array_equal(l_min, l_table.searchsorted(l_threshold) + 1)
+
+
+def test_bb_relativistic_packets_independent_of_dtype():
+    packets = []
+    for dtype in (np.float32, np.float64):
+        bb = BlackBodySimpleSourceRelativistic(
+            time_explosion=13 * u.day,
+            radius=1e14 * u.cm,
+            temperature=10000,
+            base_seed=1963,
+        )
+        bb.create_packet_seeds(100, seed_offset=0)
+        packets.append(bb.create_packets(100, dtype=dtype))
+    np.testing.assert_allclose(packets[0].nus, packets[1].nus, rtol=1e-6)
+
+
+def test_bb_relativistic_create_packets_needs_temperature():
+    bb = BlackBodySimpleSourceRelativistic(
+        time_explosion=13 * u.day, radius=1e14 * u.cm, base_seed=1963
+    )
+    with pytest.raises(ValueError, match="Temperature"):
+        bb.create_packets(100)
+
+
+def test_bb_create_packets_uses_overridden_samplers():
+    class ConstantNuSource(BlackBodySimpleSource):
+        def create_packet_nus(self, no_of_packets, dtype=np.float64):
+            return np.full(no_of_packets, 1e15, dtype=dtype)
+
+    source = ConstantNuSource(radius=1e14, temperature=10000, base_seed=1963)
+    source.create_packet_seeds(100, seed_offset=0)
+    packets = source.create_packets(100)
+    np.testing.assert_array_equal(packets.nus, 1e15)
+    assert np.all((packets.mus >= 0) & (packets.mus <= 1))
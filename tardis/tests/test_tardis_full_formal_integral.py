@@ -1,4 +1,6 @@
 import os
+from copy import deepcopy
+
 import pytest
 import numpy.testing as npt
 from astropy import units as u
@@ -11,12 +13,19 @@ config_line_modes = ["downbranch", "macroatom"]
 interpolate_shells = [-1, 30]
 
 
-@pytest.fixture(scope="module", params=config_line_modes)
-def base_config(request):
-    config = Configuration.from_yaml(
+@pytest.fixture(scope="session")
+def verysimple_config():
+    return Configuration.from_yaml(
         "tardis/io/tests/data/tardis_configv1_verysimple.yml"
     )
 
+
+@pytest.fixture(scope="module", params=config_line_modes)
+def base_config(request, verysimple_config):
+    # the YAML file is parsed and validated once; every line mode gets its
+    # own copy so the modifications below do not leak between parameters
+    config = deepcopy(verysimple_config)
+
     config["plasma"]["line_interaction_type"] = request.param
     config["montecarlo"]["no_of_packets"] = 4.0e4
     config["montecarlo"]["last_no_of_packets"] = 1.0e5
@@ -28,7 +37,23 @@ def base_config(request):
     return config
 
 
-@pytest.fixture(scope="module", params=interpolate_shells)
+@pytest.fixture(scope="module")
+def simulation(base_config, atomic_data_fname):
+    # interpolate_shells only enters the formal integral, which is evaluated
+    # after the run, so one simulation per line interaction type is shared by
+    # all interpolate_shells values
+    base_config.atom_data = atomic_data_fname
+
+    simulation = Simulation.from_config(base_config)
+    simulation.run_convergence()
+    simulation.run_final()
+
+    return simulation
+
+
+# class scoped, so pytest groups the tests by the module scoped line
+# interaction type and sets up every simulation only once
+@pytest.fixture(scope="class", params=interpolate_shells)
 def config(base_config, request):
     base_config["spectrum"]["integrated"]["interpolate_shells"] = request.param
     return base_config
@@ -43,17 +68,15 @@ class TestTransportSimpleFormalIntegral:
 
     @pytest.fixture(scope="class")
     def transport(
-        self, config, atomic_data_fname, tardis_ref_data, generate_reference
+        self, simulation, config, tardis_ref_data, generate_reference
     ):
-        config.atom_data = atomic_data_fname
-
         self.name = self._name + f"_{config.plasma.line_interaction_type:s}"
         if config.spectrum.integrated.interpolate_shells > 0:
             self.name += "_interp"
 
-        simulation = Simulation.from_config(config)
-        simulation.run_convergence()
-        simulation.run_final()
+        # setting the integrator settings recomputes the integrated spectrum
+        # with the current interpolate_shells
+        simulation.transport.integrator_settings = config.spectrum.integrated
 
         if not generate_reference:
             return simulation.transport